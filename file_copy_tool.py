@@ -6,19 +6,79 @@
 """
 
 import os
+import errno
+import json
 import shutil
 import configparser
 import sys
+import queue
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
 from tkinter import ttk
 
+try:
+    import fcntl
+except ImportError:
+    # Windows 下没有 fcntl，无法使用 reflink
+    fcntl = None
+
+# 默认并发复制线程数（目标为单块机械硬盘时建议设为 1，避免文件碎片）
+DEFAULT_WORKERS = 8
+# 并发线程数上限，配置值超过时按上限执行
+MAX_WORKERS = 32
+# 文件复制缓冲区大小（1 MiB）
+COPY_BUFSIZE = 1024 * 1024
+# 不低于该大小的文件使用双缓冲复制，读写重叠进行
+DOUBLE_BUFFER_THRESHOLD = 4 * COPY_BUFSIZE
+# Linux 下可使用 reflink / copy_file_range / sendfile 在内核中直接复制文件内容
+_IS_LINUX = sys.platform.startswith('linux')
+_USE_REFLINK = fcntl is not None and _IS_LINUX
+_USE_COPY_FILE_RANGE = hasattr(os, 'copy_file_range') and _IS_LINUX
+_USE_SENDFILE = hasattr(os, 'sendfile') and _IS_LINUX
+# ioctl FICLONE：在支持写时复制的文件系统（btrfs、xfs 等）上共享数据块
+FICLONE = 0x40049409
+# 流水线复制时每批提交的文件数
+STREAM_BATCH_SIZE = 64
+# 流水线中待复制匹配结果的队列上限，限制内存占用
+MATCH_QUEUE_SIZE = 10000
+# 流水线复制时等待新匹配结果的间隔（秒），超时后先提交已累积的部分批次并汇总进度
+STREAM_FLUSH_INTERVAL = 0.1
+# 复制日志最多保留的条数
+MAX_LOG_ENTRIES = 100000
+# 复制日志状态及对应的格式，日志以 (状态, 源路径, 目标路径, 错误) 元组保存，输出时再格式化
+LOG_COPIED = 'copied'
+LOG_UPDATED = 'updated'
+LOG_SKIPPED = 'skipped'
+LOG_FAILED = 'failed'
+LOG_FORMATS = {
+    LOG_COPIED: "复制成功：{name} -> {target_dir}",
+    LOG_UPDATED: "更新成功：{name} -> {target_dir}",
+    LOG_SKIPPED: "跳过：{name} 已存在于 {target_dir} 且未变更",
+    LOG_FAILED: "复制失败：{name} -> {target_dir}，错误：{error}",
+}
+# 内核快速复制不适用时返回的错误码，遇到这些错误时回退到下一种复制方式
+_FALLBACK_ERRNOS = (errno.EINVAL, errno.ENOSYS, errno.ENOTSUP, errno.EOPNOTSUPP,
+                    errno.EXDEV, errno.ENOTSOCK)
+
 class ConfigManager:
     """配置管理模块"""
+    DEFAULTS = {
+        'source_dir': '',
+        'target_dir': '',
+        'file_extension': '',
+        'workers': str(DEFAULT_WORKERS)
+    }
+    
     def __init__(self, config_file='config.ini'):
         self.config_file = config_file
         self.config = configparser.ConfigParser()
+        # 内存中的配置缓存，修改后需调用 flush() 写入文件
+        self._cached = {}
+        self._dirty = False
         self._init_config()
     
     def _init_config(self):
@@ -26,36 +86,40 @@ class ConfigManager:
         if not os.path.exists(self.config_file):
             self._create_default_config()
         self.config.read(self.config_file, encoding='utf-8')
+        defaults = self.config['DEFAULT']
+        self._cached = {key: defaults.get(key, value) for key, value in self.DEFAULTS.items()}
     
     def _create_default_config(self):
         """创建默认配置文件"""
-        self.config['DEFAULT'] = {
-            'source_dir': '',
-            'target_dir': '',
-            'file_extension': ''
-        }
+        self.config['DEFAULT'] = self.DEFAULTS
         with open(self.config_file, 'w', encoding='utf-8') as f:
             self.config.write(f)
     
     def get_config(self):
         """获取配置"""
-        return {
-            'source_dir': self.config['DEFAULT']['source_dir'],
-            'target_dir': self.config['DEFAULT']['target_dir'],
-            'file_extension': self.config['DEFAULT']['file_extension']
+        return dict(self._cached)
+    
+    def update_config(self, source_dir=None, target_dir=None, file_extension=None, workers=None):
+        """更新配置（仅更新内存，调用 flush() 后写入文件）"""
+        updates = {
+            'source_dir': source_dir,
+            'target_dir': target_dir,
+            'file_extension': file_extension,
+            'workers': workers
         }
+        for key, value in updates.items():
+            if value is not None and self._cached[key] != str(value):
+                self._cached[key] = str(value)
+                self._dirty = True
     
-    def update_config(self, source_dir=None, target_dir=None, file_extension=None):
-        """更新配置"""
-        if source_dir is not None:
-            self.config['DEFAULT']['source_dir'] = source_dir
-        if target_dir is not None:
-            self.config['DEFAULT']['target_dir'] = target_dir
-        if file_extension is not None:
-            self.config['DEFAULT']['file_extension'] = file_extension
-        
+    def flush(self):
+        """将有变更的配置写入文件"""
+        if not self._dirty:
+            return
+        self.config['DEFAULT'] = self._cached
         with open(self.config_file, 'w', encoding='utf-8') as f:
             self.config.write(f)
+        self._dirty = False
     
     def validate_config(self, config):
         """验证配置有效性"""
@@ -65,84 +129,566 @@ class ConfigManager:
             return False, "目标目录无效"
         if not config['file_extension']:
             return False, "文件后缀不能为空"
+        workers = str(config.get('workers', DEFAULT_WORKERS))
+        if not workers.isdecimal() or int(workers) < 1:
+            return False, "并发数必须为正整数"
         return True, "配置有效"
 
 class DirectoryMatcher:
     """目录遍历与匹配模块"""
-    def __init__(self, target_dir):
+    def __init__(self, target_dir, workers=DEFAULT_WORKERS, cache_file=None):
         self.target_dir = target_dir
-        self.file_index = {}
+        self.workers = min(MAX_WORKERS, max(1, int(workers)))
+        self.cache_file = cache_file
+        # 文件索引：无后缀文件名 -> 所在目录列表（同名文件可能位于多个目录）
+        self.file_index = defaultdict(list)
+        # 目标文件夹中已有文件的 (所在目录, 文件名) 集合，供复制阶段判断目标是否存在
+        self.file_set = set()
+        # iter_pipeline 产出的匹配结果数量
+        self.match_count = 0
+        self.warnings = []
+        # 目录缓存：目录路径 -> [目录修改时间, 文件名列表, 子目录列表]
+        self.dir_cache = {}
     
-    def build_file_index(self):
-        """构建目标文件夹文件索引"""
-        for root, dirs, files in os.walk(self.target_dir):
-            for file in files:
-                # 获取无后缀文件名
-                file_name_without_ext = os.path.splitext(file)[0]
-                # 保存文件路径
-                self.file_index[file_name_without_ext] = root
+    def build_file_index(self, on_indexed=None):
+        """构建目标文件夹文件索引（多线程并发遍历子目录）
+        
+        on_indexed 不为空时，每扫描完一个目录即在遍历线程中调用
+        on_indexed(目录, 该目录新增的无后缀文件名列表, 该目录文件名列表)
+        """
+        old_cache = self._load_dir_cache()
+        dir_queue = queue.Queue()
+        dir_queue.put(self.target_dir)
+        # 每个线程写入各自的索引和缓存，遍历结束后再合并，避免锁竞争
+        local_states = [(defaultdict(list), set(), {}) for _ in range(self.workers)]
+        
+        # 遍历线程中的意外异常，全部目录处理完毕后在调用线程中抛出
+        errors = []
+        
+        def worker(local_index, local_files, local_cache):
+            while True:
+                dir_path = dir_queue.get()
+                if dir_path is None:
+                    break
+                try:
+                    self._scan_dir(dir_path, old_cache, local_index, local_files, local_cache,
+                                   dir_queue, on_indexed)
+                except Exception as e:
+                    # 记录异常后继续处理队列，避免线程退出导致剩余目录无人处理
+                    errors.append(e)
+                finally:
+                    dir_queue.task_done()
+        
+        threads = [threading.Thread(target=worker, args=state, daemon=True)
+                   for state in local_states]
+        for thread in threads:
+            thread.start()
+        
+        # 所有目录（包括遍历中新发现的子目录）处理完毕后通知线程退出
+        dir_queue.join()
+        for _ in threads:
+            dir_queue.put(None)
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        
+        for local_index, local_files, local_cache in local_states:
+            for name, dirs in local_index.items():
+                self.file_index[name].extend(dirs)
+            self.file_set |= local_files
+            self.dir_cache.update(local_cache)
+        self._save_dir_cache(old_cache)
+    
+    def _scan_dir(self, dir_path, old_cache, local_index, local_files, local_cache, dir_queue, on_indexed=None):
+        """扫描单个目录，文件写入索引，子目录加入待遍历队列"""
+        try:
+            # 先取修改时间再读取目录，遍历期间发生的变更会在下次运行时重新扫描
+            mtime = os.stat(dir_path).st_mtime_ns
+            cached = old_cache.get(dir_path)
+            if cached and cached[0] == mtime:
+                # 目录内容未变更，直接使用缓存，无需重新读取目录
+                _, files, subdirs = cached
+            else:
+                files, subdirs = [], []
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.is_file():
+                            files.append(entry.name)
+        except OSError:
+            # 与 os.walk 一致，忽略无法访问的目录
+            return
+        
+        local_cache[dir_path] = [mtime, files, subdirs]
+        put = dir_queue.put
+        for subdir in subdirs:
+            put(subdir)
+        
+        # 热点循环中提前绑定函数，避免逐个文件查找属性
+        add_file = local_files.add
+        new_names = [] if on_indexed else None
+        for file in files:
+            add_file((dir_path, file))
+            # 获取无后缀文件名（与 os.path.splitext 结果一致：无后缀或仅以点开头时保留原名）
+            base = file.rpartition('.')[0]
+            file_name_without_ext = base if base.lstrip('.') else file
+            # 保存文件所在目录（同一目录下的同名不同后缀文件只记录一次）
+            dirs = local_index[file_name_without_ext]
+            if not dirs or dirs[-1] != dir_path:
+                dirs.append(dir_path)
+                if new_names is not None:
+                    new_names.append(file_name_without_ext)
+        
+        if new_names:
+            on_indexed(dir_path, new_names, files)
+    
+    def _load_dir_cache(self):
+        """读取当前目标目录的目录缓存"""
+        if not self.cache_file:
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                cache = json.load(f).get(self.target_dir, {})
+        except (OSError, ValueError, AttributeError):
+            # 缓存不存在或已损坏时重新完整遍历
+            return {}
+        if not isinstance(cache, dict):
+            return {}
+        # 只保留格式正确的条目：[目录修改时间, 文件名列表, 子目录列表]
+        return {dir_path: entry for dir_path, entry in cache.items()
+                if isinstance(entry, list) and len(entry) == 3
+                and isinstance(entry[1], list) and isinstance(entry[2], list)}
+    
+    def _save_dir_cache(self, old_cache):
+        """保存目录缓存（按目标目录分别存放），缓存仅用于加速，保存失败不影响复制"""
+        if not self.cache_file or self.dir_cache == old_cache:
+            return
+        try:
+            try:
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    cache = json.load(f)
+                if not isinstance(cache, dict):
+                    cache = {}
+            except (OSError, ValueError):
+                cache = {}
+            cache[self.target_dir] = self.dir_cache
+            # 先写入临时文件再替换，避免中途退出导致缓存文件损坏
+            tmp_file = f"{self.cache_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, ensure_ascii=False)
+            os.replace(tmp_file, self.cache_file)
+        except OSError:
+            pass
+    
+    def iter_pipeline(self, source_dir, file_extension):
+        """边构建目标文件索引边产出匹配的 (源路径, 目标路径)，供复制阶段同时进行
+        
+        已存在的目标文件会在产出前加入 file_set，遍历结束后 file_index 与 build_file_index 结果一致
+        """
+        # 源目录只有一层，先扫描得到 无后缀文件名 -> [(文件名, 源路径)]
+        sources = defaultdict(list)
+        with os.scandir(source_dir) as it:
+            for entry in it:
+                file = entry.name
+                if file.endswith(file_extension) and entry.is_file():
+                    base = file.rpartition('.')[0]
+                    sources[base if base.lstrip('.') else file].append((file, entry.path))
+        
+        match_queue = queue.Queue(maxsize=MATCH_QUEUE_SIZE)
+        errors = []
+        sep = os.sep
+        sources_get = sources.get
+        add_existing = self.file_set.add
+        
+        def on_indexed(dir_path, names, files):
+            existing = None
+            for name in names:
+                for file, source_path in sources_get(name, ()):
+                    if existing is None:
+                        existing = set(files)
+                    if file in existing:
+                        add_existing((dir_path, file))
+                    match_queue.put((source_path, f"{dir_path}{sep}{file}"))
+        
+        def index_job():
+            try:
+                self.build_file_index(on_indexed)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                match_queue.put(None)
+        
+        thread = threading.Thread(target=index_job, daemon=True)
+        thread.start()
+        finished = False
+        try:
+            while True:
+                item = match_queue.get()
+                if item is None:
+                    finished = True
+                    break
+                self.match_count += 1
+                yield item
+        finally:
+            # 提前停止消费时继续取出剩余结果，避免遍历线程阻塞在已满的队列上
+            while not finished:
+                finished = match_queue.get() is None
+            thread.join()
+        
+        if errors:
+            raise errors[0]
+        for name, files in sources.items():
+            target_dirs = self.file_index.get(name, ())
+            if len(target_dirs) > 1:
+                for file, _ in files:
+                    self.warnings.append(f"注意：{file} 在目标文件夹中匹配到 {len(target_dirs)} 个子文件夹，将分别复制")
     
     def match_files(self, source_dir, file_extension):
         """匹配源文件与目标路径"""
-        match_results = []
+        return list(self.iter_matches(source_dir, file_extension))
+    
+    def iter_matches(self, source_dir, file_extension):
+        """逐个产出匹配的 (源路径, 目标路径)，复制阶段可在扫描源目录的同时开始"""
+        # 热点循环中提前绑定函数，避免逐个文件查找属性
+        index_get = self.file_index.get
+        sep = os.sep
         
         # 遍历源目录
-        for file in os.listdir(source_dir):
-            # 检查文件后缀
-            if file.endswith(file_extension):
-                # 获取无后缀文件名
-                file_name_without_ext = os.path.splitext(file)[0]
-                # 查找匹配的目标路径
-                if file_name_without_ext in self.file_index:
-                    source_path = os.path.join(source_dir, file)
-                    target_path = os.path.join(self.file_index[file_name_without_ext], file)
-                    match_results.append((source_path, target_path))
-        
-        return match_results
+        with os.scandir(source_dir) as it:
+            for entry in it:
+                file = entry.name
+                # 检查文件后缀，跳过子目录
+                if not file.endswith(file_extension) or not entry.is_file():
+                    continue
+                # 获取无后缀文件名（与 os.path.splitext 结果一致），查找匹配的目标路径
+                base = file.rpartition('.')[0]
+                target_dirs = index_get(base if base.lstrip('.') else file)
+                if not target_dirs:
+                    continue
+                # 同名文件位于多个目录时分别复制
+                if len(target_dirs) > 1:
+                    self.warnings.append(f"注意：{file} 在目标文件夹中匹配到 {len(target_dirs)} 个子文件夹，将分别复制")
+                source_path = entry.path
+                for target_dir in target_dirs:
+                    yield source_path, f"{target_dir}{sep}{file}"
 
 class IncrementalCopier:
     """增量复制模块"""
-    def __init__(self):
-        self.logs = []
+    def __init__(self, workers=DEFAULT_WORKERS, existing_files=None):
+        self.workers = max(1, int(workers))
+        # 遍历目标文件夹时得到的 (所在目录, 文件名) 集合，为 None 时逐个检查目标文件
+        self.existing_files = existing_files
+        self.logs = deque(maxlen=MAX_LOG_ENTRIES)
+        # 每个复制线程各自复用一组缓冲区，避免大量小文件逐个分配 1 MiB 缓冲区
+        self._local = threading.local()
+    
+    def _copy_file(self, source_path, target_path, exclusive=False):
+        """复制文件内容及元数据（与 shutil.copy2 语义一致），exclusive 为 True 时目标已存在则抛出 FileExistsError"""
+        with open(source_path, 'rb', buffering=0) as fsrc, open(target_path, 'xb' if exclusive else 'wb') as fdst:
+            src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+            # 依次尝试 reflink、copy_file_range、sendfile，均不可用时使用缓冲复制
+            if not ((_USE_REFLINK and self._try_reflink(src_fd, dst_fd))
+                    or (_USE_COPY_FILE_RANGE and self._copy_file_range_copy(src_fd, dst_fd))
+                    or (_USE_SENDFILE and self._sendfile_copy(src_fd, dst_fd))):
+                if os.fstat(src_fd).st_size >= DOUBLE_BUFFER_THRESHOLD:
+                    self._double_buffered_copy(fsrc, fdst)
+                else:
+                    self._buffered_copy(fsrc, fdst)
+        shutil.copystat(source_path, target_path)
+    
+    def _try_reflink(self, src_fd, dst_fd):
+        """尝试以 reflink 方式克隆文件，文件系统不支持时返回 False"""
+        try:
+            fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        except OSError:
+            # 跨文件系统、不支持写时复制等情况，克隆失败不会写入任何数据
+            return False
+        return True
+    
+    def _copy_file_range_copy(self, src_fd, dst_fd):
+        """使用 os.copy_file_range 复制（NFSv4.2 等可在服务端完成），不支持时返回 False"""
+        copied = 0
+        while True:
+            try:
+                n = os.copy_file_range(src_fd, dst_fd, 2 ** 30)
+            except OSError as e:
+                if copied == 0 and e.errno in _FALLBACK_ERRNOS:
+                    return False
+                raise
+            if n == 0:
+                # 部分内核/文件系统对非空文件也会直接返回 0，首次调用即返回 0 时回退到其他方式
+                return copied > 0
+            copied += n
+    
+    def _sendfile_copy(self, src_fd, dst_fd):
+        """使用 os.sendfile 零拷贝复制，不支持时返回 False 以便回退"""
+        offset = 0
+        while True:
+            try:
+                sent = os.sendfile(dst_fd, src_fd, offset, 2 ** 31 - 1)
+            except OSError as e:
+                # 尚未写入任何数据且属于不支持的情形（非普通文件、跨文件系统等），回退到缓冲复制
+                if offset == 0 and e.errno in _FALLBACK_ERRNOS:
+                    return False
+                raise
+            if sent == 0:
+                return True
+            offset += sent
+    
+    def _get_buffers(self):
+        """获取当前线程复用的两个复制缓冲区"""
+        bufs = getattr(self._local, 'bufs', None)
+        if bufs is None:
+            bufs = self._local.bufs = (bytearray(COPY_BUFSIZE), bytearray(COPY_BUFSIZE))
+        return bufs
+    
+    def _buffered_copy(self, fsrc, fdst):
+        """使用可复用的大缓冲区 readinto 循环复制文件内容"""
+        buf = self._get_buffers()[0]
+        mv = memoryview(buf)
+        while True:
+            n = fsrc.readinto(buf)
+            if not n:
+                break
+            fdst.write(mv[:n])
+    
+    def _double_buffered_copy(self, fsrc, fdst):
+        """双缓冲复制：读取线程填充一个缓冲区的同时，当前线程写出另一个缓冲区"""
+        free_bufs = queue.Queue()
+        filled_bufs = queue.Queue()
+        for buf in self._get_buffers():
+            free_bufs.put(buf)
+        stop = threading.Event()
+        
+        def reader():
+            try:
+                while True:
+                    buf = free_bufs.get()
+                    if stop.is_set():
+                        break
+                    n = fsrc.readinto(buf)
+                    filled_bufs.put((buf, n))
+                    if not n:
+                        break
+            except Exception as e:
+                # 读取异常交由写入线程抛出
+                filled_bufs.put((None, e))
+        
+        thread = threading.Thread(target=reader, daemon=True)
+        thread.start()
+        try:
+            while True:
+                buf, n = filled_bufs.get()
+                if buf is None:
+                    raise n
+                if not n:
+                    break
+                with memoryview(buf) as mv:
+                    fdst.write(mv[:n])
+                free_bufs.put(buf)
+        finally:
+            # 写入提前结束时唤醒读取线程退出，并等待其结束后再关闭文件
+            stop.set()
+            free_bufs.put(None)
+            thread.join()
+    
+    def _copy_one(self, source_path, target_path):
+        """复制单个文件，返回 (是否实际执行了复制, 日志)"""
+        if self.existing_files is not None and os.path.split(target_path) not in self.existing_files:
+            # 遍历时目标文件不存在，直接以独占方式创建，无需再检查；期间被其他进程创建时按已存在处理
+            try:
+                self._copy_file(source_path, target_path, exclusive=True)
+                return True, (LOG_COPIED, source_path, target_path, None)
+            except FileExistsError:
+                pass
+        
+        try:
+            target_stat = os.stat(target_path)
+        except FileNotFoundError:
+            target_stat = None
+        
+        if target_stat is None:
+            # 文件不存在，执行复制（失败时异常交由调用方记录）
+            self._copy_file(source_path, target_path)
+            return True, (LOG_COPIED, source_path, target_path, None)
+        
+        source_stat = os.stat(source_path)
+        if (source_stat.st_size == target_stat.st_size
+                and int(source_stat.st_mtime) == int(target_stat.st_mtime)):
+            # 大小与修改时间一致，视为未变更，不打开文件直接跳过
+            return False, (LOG_SKIPPED, source_path, target_path, None)
+        
+        # 源文件有变更，重新复制覆盖
+        self._copy_file(source_path, target_path)
+        return True, (LOG_UPDATED, source_path, target_path, None)
     
-    def copy_files(self, match_results, progress_callback=None):
-        """增量复制文件"""
+    def _copy_batch(self, batch):
+        """在工作线程中复制一批文件，返回 (复制数, 跳过数, 日志列表)"""
         copied_count = 0
         skipped_count = 0
-        total_files = len(match_results)
-        
-        for i, (source_path, target_path) in enumerate(match_results):
-            # 检查目标文件是否已存在
-            if os.path.exists(target_path):
-                # 文件已存在，跳过
-                log = f"跳过：{os.path.basename(source_path)} 已存在于 {os.path.dirname(target_path)}"
-                self.logs.append(log)
-                skipped_count += 1
+        logs = []
+        for source_path, target_path in batch:
+            try:
+                copied, log = self._copy_one(source_path, target_path)
+            except Exception as e:
+                log = (LOG_FAILED, source_path, target_path, str(e))
             else:
-                # 文件不存在，执行复制
-                try:
-                    shutil.copy2(source_path, target_path)
-                    log = f"复制成功：{os.path.basename(source_path)} -> {os.path.dirname(target_path)}"
-                    self.logs.append(log)
+                if copied:
                     copied_count += 1
-                except Exception as e:
-                    log = f"复制失败：{os.path.basename(source_path)} -> {os.path.dirname(target_path)}，错误：{str(e)}"
-                    self.logs.append(log)
-            
-            # 调用进度回调函数
-            if progress_callback:
-                progress = (i + 1) / total_files * 100
-                progress_callback(progress)
+                else:
+                    skipped_count += 1
+            logs.append(log)
+        return copied_count, skipped_count, logs
+    
+    def _ensure_target_dir(self, target_dir):
+        """创建缺失的目标目录"""
+        try:
+            os.makedirs(target_dir, exist_ok=True)
+        except OSError:
+            # 创建失败时由对应文件的复制记录错误
+            pass
+    
+    def copy_files(self, match_results, progress_callback=None, log_callback=None):
+        """增量复制文件（分批提交到线程池并发执行），log_callback 接收每批完成后的日志列表"""
+        total_files = len(match_results)
+        if not total_files:
+            return 0, 0
+        
+        # 复制前一次性创建所有缺失的目标目录，每个目录只处理一次
+        for target_dir in {os.path.dirname(target_path) for _, target_path in match_results}:
+            self._ensure_target_dir(target_dir)
+        
+        max_workers = min(MAX_WORKERS, self.workers, total_files)
+        # 每个线程约分到 4 批，兼顾负载均衡与减少任务调度开销
+        batch_size = max(1, total_files // (4 * max_workers))
+        batches = (match_results[i:i + batch_size] for i in range(0, total_files, batch_size))
+        
+        def on_progress(processed):
+            progress_callback(processed / total_files * 100)
+        
+        return self._run_batches(batches, max_workers, on_progress if progress_callback else None, log_callback)
+    
+    def copy_stream(self, matches, progress_callback=None, log_callback=None):
+        """边接收匹配结果边复制（匹配结果总数未知），progress_callback 接收已处理的文件数，log_callback 接收每批日志"""
+        # 在单独线程中读取匹配结果，复制线程池因此能在等待新结果时及时提交部分批次
+        feed = queue.Queue(maxsize=MATCH_QUEUE_SIZE)
+        
+        def feeder():
+            try:
+                for item in matches:
+                    feed.put(item)
+            except Exception as e:
+                # 读取异常交由调用线程抛出
+                feed.put(e)
+            finally:
+                feed.put(None)
+        
+        thread = threading.Thread(target=feeder, daemon=True)
+        thread.start()
+        created_dirs = set()
+        
+        def batches():
+            batch = []
+            finished = False
+            try:
+                while True:
+                    try:
+                        item = feed.get(timeout=STREAM_FLUSH_INTERVAL)
+                    except queue.Empty:
+                        # 暂无新结果：提交已累积的部分批次（为空时仅用于汇总已完成的批次）
+                        yield batch
+                        batch = []
+                        continue
+                    if item is None:
+                        finished = True
+                        break
+                    if isinstance(item, Exception):
+                        finished = True
+                        raise item
+                    
+                    source_path, target_path = item
+                    # 目标目录首次出现时创建
+                    target_dir = os.path.dirname(target_path)
+                    if target_dir not in created_dirs:
+                        created_dirs.add(target_dir)
+                        self._ensure_target_dir(target_dir)
+                    batch.append(item)
+                    # 批次已满或暂无更多结果时立即提交，不等待凑满一批
+                    if len(batch) >= STREAM_BATCH_SIZE or feed.empty():
+                        yield batch
+                        batch = []
+                if batch:
+                    yield batch
+            finally:
+                # 提前结束时继续取出剩余结果，避免读取线程阻塞在已满的队列上
+                while not finished:
+                    finished = feed.get() is None
+                thread.join()
+        
+        batch_iter = batches()
+        try:
+            return self._run_batches(batch_iter, min(MAX_WORKERS, self.workers), progress_callback, log_callback)
+        finally:
+            batch_iter.close()
+    
+    def _run_batches(self, batches, max_workers, progress_callback=None, log_callback=None):
+        """将批次提交到线程池执行并汇总结果，progress_callback 接收已处理的文件数，log_callback 接收每批日志
+        
+        batches 中的空批次不会提交，仅用于及时汇总已完成的批次
+        """
+        copied_count = 0
+        skipped_count = 0
+        processed = 0
+        pending = {}
+        
+        # 在调用线程中汇总结果，保证进度回调不在工作线程中执行
+        def collect(done):
+            nonlocal copied_count, skipped_count, processed
+            for future in done:
+                batch_copied, batch_skipped, batch_logs = future.result()
+                copied_count += batch_copied
+                skipped_count += batch_skipped
+                self.logs.extend(batch_logs)
+                if log_callback:
+                    log_callback(batch_logs)
+                
+                # 调用进度回调函数
+                processed += pending.pop(future)
+                if progress_callback:
+                    progress_callback(processed)
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for batch in batches:
+                if batch:
+                    pending[executor.submit(self._copy_batch, batch)] = len(batch)
+                if not pending:
+                    continue
+                # 不阻塞地汇总已完成的批次，及时报告进度
+                collect(wait(pending, timeout=0).done)
+                # 限制未完成的批次数量，避免批次生成快于复制时占用过多内存
+                if len(pending) >= 4 * max_workers:
+                    collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            while pending:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
         
         return copied_count, skipped_count
     
+    @staticmethod
+    def format_log(entry):
+        """将日志元组格式化为文本"""
+        status, source_path, target_path, error = entry
+        return LOG_FORMATS[status].format(name=os.path.basename(source_path),
+                                          target_dir=os.path.dirname(target_path), error=error)
+    
     def save_logs(self, log_file='copy_log.txt'):
         """保存操作日志"""
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(f"\n{'='*50}\n")
-            f.write(f"操作时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            for log in self.logs:
-                f.write(f"{log}\n")
+        # 日志在此时才统一格式化，拼接后一次性写入
+        header = f"\n{'='*50}\n操作时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+        body = ''.join(f"{self.format_log(entry)}\n" for entry in self.logs)
+        with open(log_file, 'a', encoding='utf-8', buffering=1 << 20) as f:
+            f.write(header + body)
 
 class MainController:
     """主控制模块"""
@@ -167,6 +713,7 @@ class MainController:
             elif choice == '3':
                 self._execute_copy()
             elif choice == '4':
+                self.config_manager.flush()
                 print("感谢使用，再见！")
                 break
             else:
@@ -179,6 +726,7 @@ class MainController:
         print(f"源目录：{config['source_dir']}")
         print(f"目标目录：{config['target_dir']}")
         print(f"文件后缀：{config['file_extension']}")
+        print(f"并发数：{config['workers']}")
     
     def _modify_config(self):
         """修改配置"""
@@ -188,9 +736,11 @@ class MainController:
         source_dir = input(f"源目录 [{current_config['source_dir']}]：").strip() or current_config['source_dir']
         target_dir = input(f"目标目录 [{current_config['target_dir']}]：").strip() or current_config['target_dir']
         file_extension = input(f"文件后缀 [{current_config['file_extension']}]：").strip() or current_config['file_extension']
+        workers = input(f"并发数 [{current_config['workers']}]：").strip() or current_config['workers']
         
         # 更新配置
-        self.config_manager.update_config(source_dir, target_dir, file_extension)
+        self.config_manager.update_config(source_dir, target_dir, file_extension, workers)
+        self.config_manager.flush()
         print("配置已更新！")
     
     def _execute_copy(self):
@@ -207,33 +757,28 @@ class MainController:
         
         print("\n开始执行文件复制...")
         
-        # 1. 构建目标文件索引
-        print("正在构建目标文件索引...")
-        matcher = DirectoryMatcher(config['target_dir'])
-        matcher.build_file_index()
+        # 1. 构建目标文件索引、匹配源文件与增量复制同时进行
+        print("正在构建目标文件索引并执行增量复制...")
+        matcher = DirectoryMatcher(config['target_dir'], config['workers'], cache_file='index_cache.json')
+        copier = IncrementalCopier(config['workers'], matcher.file_set)
+        copied_count, skipped_count = copier.copy_stream(
+            matcher.iter_pipeline(config['source_dir'], config['file_extension']))
         print(f"共索引到 {len(matcher.file_index)} 个文件")
+        for warning in matcher.warnings:
+            print(warning)
+        print(f"共匹配到 {matcher.match_count} 个文件")
         
-        # 2. 匹配源文件
-        print("正在匹配源文件...")
-        match_results = matcher.match_files(config['source_dir'], config['file_extension'])
-        print(f"共匹配到 {len(match_results)} 个文件")
-        
-        if not match_results:
+        if not matcher.match_count:
             print("没有找到匹配的文件，无需复制！")
             return
         
-        # 3. 执行增量复制
-        print("正在执行增量复制...")
-        copier = IncrementalCopier()
-        copied_count, skipped_count = copier.copy_files(match_results)
-        
-        # 4. 保存日志
+        # 2. 保存日志
         copier.save_logs()
         
-        # 5. 输出结果
+        # 3. 输出结果
         print("\n复制完成！")
         print(f"成功复制：{copied_count} 个文件")
-        print(f"跳过已存在：{skipped_count} 个文件")
+        print(f"跳过未变更：{skipped_count} 个文件")
         print(f"日志已保存到 copy_log.txt")
 
 class GUIController:
@@ -244,6 +789,12 @@ class GUIController:
         self.root.title("文件复制工具")
         self.root.geometry("600x500")
         self.root.resizable(True, True)
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        # 后台复制线程通过事件队列向界面线程传递日志和进度
+        self.event_queue = queue.Queue()
+        self.copy_thread = None
+        # 复制过程中请求关闭窗口时，待复制结束后再关闭
+        self.close_requested = False
         
         # 初始化界面
         self._init_ui()
@@ -280,12 +831,19 @@ class GUIController:
         self.file_ext_entry = tk.Entry(config_frame, textvariable=self.file_ext_var, width=10)
         self.file_ext_entry.grid(row=2, column=1, padx=5, pady=5, sticky=tk.W)
         
+        # 并发数
+        tk.Label(config_frame, text="并发数：").grid(row=3, column=0, sticky=tk.W, pady=5)
+        self.workers_var = tk.StringVar()
+        self.workers_entry = tk.Entry(config_frame, textvariable=self.workers_var, width=10)
+        self.workers_entry.grid(row=3, column=1, padx=5, pady=5, sticky=tk.W)
+        
         # 操作按钮区域
         button_frame = tk.Frame(main_frame)
         button_frame.pack(fill=tk.X, pady=(0, 10))
         
         tk.Button(button_frame, text="保存配置", command=self._save_config, width=15).pack(side=tk.LEFT, padx=5)
-        tk.Button(button_frame, text="执行复制", command=self._execute_copy, width=15, bg="#4CAF50", fg="white").pack(side=tk.LEFT, padx=5)
+        self.execute_button = tk.Button(button_frame, text="执行复制", command=self._execute_copy, width=15, bg="#4CAF50", fg="white")
+        self.execute_button.pack(side=tk.LEFT, padx=5)
         tk.Button(button_frame, text="清空日志", command=self._clear_log, width=15).pack(side=tk.LEFT, padx=5)
         
         # 进度条区域
@@ -325,19 +883,22 @@ class GUIController:
         self.source_dir_var.set(config['source_dir'])
         self.target_dir_var.set(config['target_dir'])
         self.file_ext_var.set(config['file_extension'])
+        self.workers_var.set(config['workers'])
     
     def _save_config(self):
         """保存配置"""
         source_dir = self.source_dir_var.get().strip()
         target_dir = self.target_dir_var.get().strip()
         file_ext = self.file_ext_var.get().strip()
+        workers = self.workers_var.get().strip()
         
         # 验证配置
-        config = {'source_dir': source_dir, 'target_dir': target_dir, 'file_extension': file_ext}
+        config = {'source_dir': source_dir, 'target_dir': target_dir, 'file_extension': file_ext, 'workers': workers}
         is_valid, msg = self.config_manager.validate_config(config)
         
         if is_valid:
-            self.config_manager.update_config(source_dir, target_dir, file_ext)
+            self.config_manager.update_config(source_dir, target_dir, file_ext, workers)
+            self.config_manager.flush()
             messagebox.showinfo("成功", "配置已保存！")
         else:
             messagebox.showerror("错误", f"配置无效：{msg}")
@@ -348,89 +909,129 @@ class GUIController:
         source_dir = self.source_dir_var.get().strip()
         target_dir = self.target_dir_var.get().strip()
         file_ext = self.file_ext_var.get().strip()
+        workers = self.workers_var.get().strip()
         
         # 验证配置
-        config = {'source_dir': source_dir, 'target_dir': target_dir, 'file_extension': file_ext}
+        config = {'source_dir': source_dir, 'target_dir': target_dir, 'file_extension': file_ext, 'workers': workers}
         is_valid, msg = self.config_manager.validate_config(config)
         
         if not is_valid:
             messagebox.showerror("错误", f"配置无效：{msg}")
             return
         
-        # 更新配置
-        self.config_manager.update_config(source_dir, target_dir, file_ext)
+        # 更新配置（关闭窗口时写入文件）
+        self.config_manager.update_config(source_dir, target_dir, file_ext, workers)
         
-        # 显示开始信息
-        self._add_log("开始执行文件复制...")
-        self.root.update()
+        # 复制期间禁用按钮，防止重复执行
+        self.execute_button.config(state=tk.DISABLED)
+        # 边遍历边复制时文件总数未知，进度条以滚动方式显示，并显示已处理文件数
+        self.progress_bar.config(mode='indeterminate')
+        self.progress_bar.start()
+        self.progress_label.config(text="已处理 0 个文件")
         
+        # 在后台线程中执行复制，界面线程定时读取事件队列
+        self.copy_thread = threading.Thread(target=self._copy_job, args=(source_dir, target_dir, file_ext, workers), daemon=True)
+        self.copy_thread.start()
+        self.root.after(100, self._drain_queue)
+    
+    def _copy_job(self, source_dir, target_dir, file_ext, workers):
+        """后台执行文件复制，通过事件队列报告日志、进度和结果"""
+        post = self.event_queue.put
+        # 结束时弹出的提示：(类型, 标题, 内容)
+        result = None
         try:
-            # 1. 构建目标文件索引
-            self._add_log("正在构建目标文件索引...")
-            self.root.update()
-            
-            matcher = DirectoryMatcher(target_dir)
-            matcher.build_file_index()
-            self._add_log(f"共索引到 {len(matcher.file_index)} 个文件")
-            self.root.update()
+            # 显示开始信息
+            post(('log', "开始执行文件复制..."))
             
-            # 2. 匹配源文件
-            self._add_log("正在匹配源文件...")
-            self.root.update()
+            # 1. 构建目标文件索引、匹配源文件与增量复制同时进行
+            post(('log', "正在构建目标文件索引并执行增量复制..."))
+            matcher = DirectoryMatcher(target_dir, workers, cache_file='index_cache.json')
+            copier = IncrementalCopier(workers, matcher.file_set)
+            copied_count, skipped_count = copier.copy_stream(
+                matcher.iter_pipeline(source_dir, file_ext),
+                progress_callback=lambda processed: post(('progress', processed)),
+                log_callback=lambda logs: post(('logs', logs)))
+            post(('log', f"共索引到 {len(matcher.file_index)} 个文件"))
+            for warning in matcher.warnings:
+                post(('log', warning))
+            post(('log', f"共匹配到 {matcher.match_count} 个文件"))
             
-            match_results = matcher.match_files(source_dir, file_ext)
-            self._add_log(f"共匹配到 {len(match_results)} 个文件")
-            self.root.update()
-            
-            if not match_results:
-                self._add_log("没有找到匹配的文件，无需复制！")
-                messagebox.showinfo("提示", "没有找到匹配的文件，无需复制！")
+            if not matcher.match_count:
+                post(('log', "没有找到匹配的文件，无需复制！"))
+                result = ('info', "提示", "没有找到匹配的文件，无需复制！")
                 return
             
-            # 3. 执行增量复制
-            self._add_log("正在执行增量复制...")
-            self.root.update()
-            
-            # 初始化进度条
-            self.progress_var.set(0)
-            self.progress_label.config(text="0%")
-            self.root.update()
-            
-            # 进度回调函数
-            def update_progress(progress):
-                self.progress_var.set(progress)
-                self.progress_label.config(text=f"{int(progress)}%")
-                self.root.update()
-            
-            copier = IncrementalCopier()
-            copied_count, skipped_count = copier.copy_files(match_results, progress_callback=update_progress)
-            
-            # 添加复制结果到日志
-            for log in copier.logs:
-                self._add_log(log)
-            
-            # 重置进度条
-            self.progress_var.set(0)
-            self.progress_label.config(text="0%")
-            self.root.update()
-            
-            # 4. 保存日志
+            # 2. 保存日志
             copier.save_logs()
             
-            # 5. 显示结果
-            result_msg = f"复制完成！\n成功复制：{copied_count} 个文件\n跳过已存在：{skipped_count} 个文件\n日志已保存到 copy_log.txt"
-            self._add_log(result_msg)
-            messagebox.showinfo("成功", result_msg)
+            # 3. 显示结果
+            result_msg = f"复制完成！\n成功复制：{copied_count} 个文件\n跳过未变更：{skipped_count} 个文件\n日志已保存到 copy_log.txt"
+            post(('log', result_msg))
+            result = ('info', "成功", result_msg)
             
         except Exception as e:
             error_msg = f"复制过程中发生错误：{str(e)}"
-            self._add_log(error_msg)
-            messagebox.showerror("错误", error_msg)
+            post(('log', error_msg))
+            result = ('error', "错误", error_msg)
+        finally:
+            post(('done', result))
+    
+    def _drain_queue(self):
+        """在界面线程中处理后台复制线程发送的事件"""
+        # 本轮收到的日志合并后一次性插入
+        pending_logs = []
+        while True:
+            try:
+                kind, data = self.event_queue.get_nowait()
+            except queue.Empty:
+                break
+            
+            if kind == 'log':
+                pending_logs.append(data)
+            elif kind == 'logs':
+                pending_logs.extend(data)
+            elif kind == 'progress':
+                self.progress_label.config(text=f"已处理 {data} 个文件")
+            elif kind == 'done':
+                if pending_logs:
+                    self._add_logs(pending_logs)
+                if self.close_requested:
+                    # 复制已结束（日志已保存），等待线程退出后关闭窗口
+                    self.copy_thread.join()
+                    self._on_close()
+                    return
+                # 重置进度条并恢复按钮，再弹出结果提示
+                self.progress_bar.stop()
+                self.progress_bar.config(mode='determinate')
+                self.progress_var.set(0)
+                self.progress_label.config(text="0%")
+                self.execute_button.config(state=tk.NORMAL)
+                if data:
+                    box_type, title, message = data
+                    if box_type == 'error':
+                        messagebox.showerror(title, message)
+                    else:
+                        messagebox.showinfo(title, message)
+                return
+        
+        if pending_logs:
+            self._add_logs(pending_logs)
+        self.root.after(100, self._drain_queue)
     
     def _add_log(self, message):
-        """添加日志信息"""
+        """添加日志信息（支持文本或复制日志元组）"""
+        self._add_logs([message])
+    
+    def _add_logs(self, messages):
+        """批量添加日志信息，拼接后一次性插入"""
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        format_log = IncrementalCopier.format_log
+        text = ''.join(
+            f"{timestamp} - {format_log(message) if isinstance(message, tuple) else message}\n"
+            for message in messages
+        )
         self.log_text.config(state=tk.NORMAL)
-        self.log_text.insert(tk.END, f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {message}\n")
+        self.log_text.insert(tk.END, text)
         self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
     
@@ -440,6 +1041,16 @@ class GUIController:
         self.log_text.delete(1.0, tk.END)
         self.log_text.config(state=tk.DISABLED)
     
+    def _on_close(self):
+        """关闭窗口前保存配置，复制进行中时确认后待复制结束再关闭"""
+        if self.copy_thread is not None and self.copy_thread.is_alive():
+            if not self.close_requested and messagebox.askyesno("提示", "正在复制文件，是否在复制完成后关闭窗口？"):
+                self.close_requested = True
+                self._add_log("复制完成后将自动关闭窗口...")
+            return
+        self.config_manager.flush()
+        self.root.destroy()
+    
     def run(self):
         """运行图形界面"""
         self.root.mainloop()
@@ -4,13 +4,17 @@
 测试脚本：验证文件复制工具核心功能
 """
 
+import json
 import os
 import shutil
 import sys
+import tempfile
+import threading
 
 # 添加当前目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+import file_copy_tool
 from file_copy_tool import ConfigManager, DirectoryMatcher, IncrementalCopier
 
 def test_file_copy():
@@ -60,7 +64,7 @@ def test_file_copy():
     print(f"复制结果：成功 {copied_count} 个，跳过 {skipped_count} 个")
     print(f"操作日志：")
     for log in copier.logs:
-        print(f"  {log}")
+        print(f"  {IncrementalCopier.format_log(log)}")
     
     # 5. 验证复制结果
     print("\n5. 验证复制结果...")
@@ -79,7 +83,7 @@ def test_file_copy():
     print(f"重复复制结果：成功 {copied_count2} 个，跳过 {skipped_count2} 个")
     print(f"操作日志：")
     for log in copier2.logs:
-        print(f"  {log}")
+        print(f"  {IncrementalCopier.format_log(log)}")
     
     print("\n=== 测试完成 ===")
     
@@ -87,5 +91,236 @@ def test_file_copy():
     if os.path.exists("test_config.ini"):
         os.remove("test_config.ini")
 
+def _write(path, data):
+    """写入测试文件"""
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def _read(path):
+    """读取测试文件"""
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _make_fixture(test_dir):
+    """创建测试目录：photo1 在两个子文件夹中都有同名文件，photo3 没有匹配
+    
+    返回 (源目录, 目标目录, 子文件夹 a, 子文件夹 b/c)
+    """
+    source_dir = os.path.join(test_dir, "source")
+    target_dir = os.path.join(test_dir, "target")
+    dir_a = os.path.join(target_dir, "a")
+    dir_b = os.path.join(target_dir, "b", "c")
+    os.makedirs(source_dir)
+    os.makedirs(dir_a)
+    os.makedirs(dir_b)
+    _write(os.path.join(source_dir, "photo1.RW2"), b"raw1" * 1000)
+    _write(os.path.join(source_dir, "photo2.RW2"), os.urandom(5 * 1024 * 1024 + 7))
+    _write(os.path.join(source_dir, "photo3.RW2"), b"no match")
+    _write(os.path.join(dir_a, "photo1.JPG"), b"jpg")
+    _write(os.path.join(dir_b, "photo1.JPG"), b"jpg")
+    _write(os.path.join(dir_b, "photo2.JPG"), b"jpg")
+    return source_dir, target_dir, dir_a, dir_b
+
+def _copy_all(source_dir, target_dir, existing_files=None):
+    """构建索引、匹配并复制，返回 (匹配结果, 复制数, 跳过数, 复制器)"""
+    matcher = DirectoryMatcher(target_dir)
+    matcher.build_file_index()
+    match_results = matcher.match_files(source_dir, ".RW2")
+    copier = IncrementalCopier(4, matcher.file_set if existing_files is None else existing_files)
+    copied_count, skipped_count = copier.copy_files(match_results)
+    return match_results, copied_count, skipped_count, copier
+
+def test_incremental_sync():
+    """测试增量同步：同名多目录分别复制、未变更跳过、变更后更新"""
+    print("\n=== 测试增量同步 ===")
+    
+    # 1. 准备测试数据：photo1 在两个子文件夹中都有同名文件
+    test_dir = tempfile.mkdtemp()
+    source_dir, target_dir, dir_a, dir_b = _make_fixture(test_dir)
+    
+    try:
+        # 2. 首次复制：photo1 分别复制到两个子文件夹
+        print("\n1. 首次复制...")
+        match_results, copied_count, skipped_count, _ = _copy_all(source_dir, target_dir)
+        print(f"复制结果：成功 {copied_count} 个，跳过 {skipped_count} 个")
+        assert len(match_results) == 3
+        assert (copied_count, skipped_count) == (3, 0)
+        for source_path, target_path in match_results:
+            assert _read(source_path) == _read(target_path)
+        assert os.path.exists(os.path.join(dir_a, "photo1.RW2"))
+        assert os.path.exists(os.path.join(dir_b, "photo1.RW2"))
+        print("✓ 同名文件已分别复制到两个子文件夹")
+        
+        # 3. 重复复制：大小与修改时间一致，全部跳过
+        print("\n2. 重复复制...")
+        _, copied_count, skipped_count, _ = _copy_all(source_dir, target_dir)
+        print(f"复制结果：成功 {copied_count} 个，跳过 {skipped_count} 个")
+        assert (copied_count, skipped_count) == (0, 3)
+        print("✓ 未变更文件全部跳过")
+        
+        # 4. 修改源文件后复制：只更新变更的文件
+        print("\n3. 修改源文件后复制...")
+        _write(os.path.join(source_dir, "photo2.RW2"), b"changed")
+        _, copied_count, skipped_count, copier = _copy_all(source_dir, target_dir)
+        print(f"复制结果：成功 {copied_count} 个，跳过 {skipped_count} 个")
+        assert (copied_count, skipped_count) == (1, 2)
+        assert [log[0] for log in copier.logs].count(file_copy_tool.LOG_UPDATED) == 1
+        assert _read(os.path.join(dir_b, "photo2.RW2")) == b"changed"
+        print("✓ 变更文件已更新")
+        
+        # 5. 遍历后目标文件才出现：独占创建失败时按已存在处理
+        print("\n4. 目标文件集合过期时复制...")
+        _, copied_count, skipped_count, _ = _copy_all(source_dir, target_dir, existing_files=set())
+        print(f"复制结果：成功 {copied_count} 个，跳过 {skipped_count} 个")
+        assert (copied_count, skipped_count) == (0, 3)
+        print("✓ 已存在文件未被覆盖")
+        
+        # 6. 内核快速复制不可用时回退到缓冲复制
+        print("\n5. 回退到缓冲复制...")
+        saved = (file_copy_tool._USE_REFLINK, file_copy_tool._USE_SENDFILE)
+        saved_copy_file_range = getattr(os, 'copy_file_range', None)
+        file_copy_tool._USE_REFLINK = file_copy_tool._USE_SENDFILE = False
+        # 模拟部分文件系统上 copy_file_range 对非空文件直接返回 0
+        os.copy_file_range = lambda *args, **kwargs: 0
+        try:
+            shutil.rmtree(target_dir)
+            os.makedirs(dir_a)
+            _write(os.path.join(dir_a, "photo1.JPG"), b"jpg")
+            _write(os.path.join(dir_a, "photo2.JPG"), b"jpg")
+            match_results, copied_count, skipped_count, _ = _copy_all(source_dir, target_dir)
+        finally:
+            file_copy_tool._USE_REFLINK, file_copy_tool._USE_SENDFILE = saved
+            if saved_copy_file_range is None:
+                del os.copy_file_range
+            else:
+                os.copy_file_range = saved_copy_file_range
+        print(f"复制结果：成功 {copied_count} 个，跳过 {skipped_count} 个")
+        assert (copied_count, skipped_count) == (2, 0)
+        for source_path, target_path in match_results:
+            assert _read(source_path) == _read(target_path)
+        print("✓ 回退复制内容一致")
+    finally:
+        shutil.rmtree(test_dir)
+    
+    print("\n=== 测试完成 ===")
+
+def _match_with_cache(source_dir, target_dir, cache_file):
+    """使用目录缓存构建索引并匹配，返回匹配到的目标路径集合"""
+    matcher = DirectoryMatcher(target_dir, cache_file=cache_file)
+    matcher.build_file_index()
+    return {target_path for _, target_path in matcher.match_files(source_dir, ".RW2")}
+
+def test_index_cache():
+    """测试目录缓存：新增文件能被匹配，缓存损坏时完整遍历"""
+    print("\n=== 测试目录缓存 ===")
+    
+    test_dir = tempfile.mkdtemp()
+    source_dir, target_dir, dir_a, dir_b = _make_fixture(test_dir)
+    cache_file = os.path.join(test_dir, "index_cache.json")
+    
+    try:
+        # 1. 首次运行生成缓存
+        print("\n1. 首次运行...")
+        targets = _match_with_cache(source_dir, target_dir, cache_file)
+        assert len(targets) == 3
+        assert os.path.exists(cache_file)
+        print(f"✓ 匹配到 {len(targets)} 个文件，缓存已生成")
+        
+        # 2. 在子文件夹中新增可匹配的文件后再次运行
+        print("\n2. 新增目标文件后运行...")
+        _write(os.path.join(dir_a, "photo3.JPG"), b"jpg")
+        targets = _match_with_cache(source_dir, target_dir, cache_file)
+        assert os.path.join(dir_a, "photo3.RW2") in targets
+        assert len(targets) == 4
+        print("✓ 新增文件已匹配")
+        
+        # 3. 缓存文件损坏或格式不正确时完整遍历
+        print("\n3. 缓存损坏时运行...")
+        for content in ("not json", "[1, 2]", json.dumps({target_dir: [1, 2]}),
+                        json.dumps({target_dir: {dir_a: [0, [], []]}})):
+            with open(cache_file, 'w', encoding='utf-8') as f:
+                f.write(content)
+            targets = _match_with_cache(source_dir, target_dir, cache_file)
+            assert len(targets) == 4, content
+        print("✓ 缓存损坏时完整遍历")
+    finally:
+        shutil.rmtree(test_dir)
+    
+    print("\n=== 测试完成 ===")
+
+def _index_snapshot(matcher):
+    """返回与遍历顺序无关的索引内容，便于比较"""
+    return {name: sorted(dirs) for name, dirs in matcher.file_index.items()}, set(matcher.file_set)
+
+def test_pipeline_copy():
+    """测试流水线复制：边遍历目标目录边复制，结果与分阶段执行一致"""
+    print("\n=== 测试流水线复制 ===")
+    
+    test_dir = tempfile.mkdtemp()
+    source_dir, target_dir, dir_a, dir_b = _make_fixture(test_dir)
+    
+    try:
+        for run, expected in ((1, (3, 0)), (2, (0, 3))):
+            print(f"\n{run}. 第 {run} 次流水线复制...")
+            reference = DirectoryMatcher(target_dir)
+            reference.build_file_index()
+            
+            matcher = DirectoryMatcher(target_dir, workers=4)
+            copier = IncrementalCopier(4, matcher.file_set)
+            copied_count, skipped_count = copier.copy_stream(matcher.iter_pipeline(source_dir, ".RW2"))
+            print(f"复制结果：成功 {copied_count} 个，跳过 {skipped_count} 个")
+            assert (copied_count, skipped_count) == expected
+            assert matcher.match_count == 3
+            assert len(matcher.warnings) == 1
+            assert _index_snapshot(matcher) == _index_snapshot(reference)
+            for name in ("photo1.RW2", "photo2.RW2"):
+                assert _read(os.path.join(source_dir, name)) == _read(os.path.join(dir_b, name))
+            assert _read(os.path.join(source_dir, "photo1.RW2")) == _read(os.path.join(dir_a, "photo1.RW2"))
+            print("✓ 复制结果及索引与分阶段执行一致")
+        
+        # 3. 匹配结果陆续到达时，不等待凑满一批即开始复制
+        print("\n3. 匹配结果陆续到达时复制...")
+        first_done = threading.Event()
+        flushed = []
+        
+        def slow_matches():
+            yield os.path.join(source_dir, "photo1.RW2"), os.path.join(test_dir, "slow", "photo1.RW2")
+            # 第一个文件复制完成前不产出下一个结果
+            flushed.append(first_done.wait(5))
+            yield os.path.join(source_dir, "photo2.RW2"), os.path.join(test_dir, "slow", "photo2.RW2")
+        
+        copier = IncrementalCopier(4)
+        result = copier.copy_stream(slow_matches(), progress_callback=lambda processed: first_done.set())
+        assert result == (2, 0)
+        assert flushed == [True]
+        print("✓ 部分批次已及时提交")
+        
+        # 4. 提前停止消费时不会阻塞
+        print("\n4. 提前关闭流水线...")
+        saved_size = file_copy_tool.MATCH_QUEUE_SIZE
+        file_copy_tool.MATCH_QUEUE_SIZE = 1
+        try:
+            matcher = DirectoryMatcher(target_dir, workers=2)
+            
+            def close_early():
+                matches = matcher.iter_pipeline(source_dir, ".RW2")
+                next(matches)
+                matches.close()
+            
+            thread = threading.Thread(target=close_early, daemon=True)
+            thread.start()
+            thread.join(10)
+        finally:
+            file_copy_tool.MATCH_QUEUE_SIZE = saved_size
+        assert not thread.is_alive()
+        print("✓ 提前关闭未阻塞")
+    finally:
+        shutil.rmtree(test_dir)
+    
+    print("\n=== 测试完成 ===")
+
 if __name__ == "__main__":
     test_file_copy()
+    test_incremental_sync()
+    test_index_cache()
+    test_pipeline_copy()